@@ -40,7 +40,7 @@ class InvariantSensor(BinarySensorEntity):
     """Representation of a sensor."""
 
     def __init__(self, hass, name, code) -> None:
-        from .parse import code_to_cnf, get_used_entities
+        from .parse import code_to_cnf, get_used_entities, get_entity_domain
         from homeassistant.helpers.event import async_track_state_change_event, async_track_time_interval
         from ast import unparse
 
@@ -56,7 +56,7 @@ class InvariantSensor(BinarySensorEntity):
         logger.debug("Tracking" + repr(self._entities))
         async_track_state_change_event(hass, list(self._entities), self.source_entity_changed)
 
-        if any((e.split('.')[0] in ('button', 'input_button')) for e in self._entities):
+        if any((get_entity_domain(e) in ('button', 'input_button')) for e in self._entities):
           from datetime import timedelta
           logger.debug("Also tracking time")
           self._time_tracking = 60 # this amount needs to be configurable
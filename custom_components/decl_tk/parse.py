@@ -275,6 +275,22 @@ def split_disjunctions(node):
     return node.values
   return [node]
 
+def get_entity_domain(entity):
+  return entity.split('.')[0]
+
+def get_actuatable_entities(entities, is_actuatable_domain):
+  return frozenset(e for e in entities if is_actuatable_domain(get_entity_domain(e)))
+
+# a clause is actuatable if at least one of its entities may receive an action.
+# Clauses over read-only domains (sensor, zone, person, ...) can never be restored by the solver.
+# Gives (clause, used entities, actuatable entities) for each clause.
+def classify_clauses(node, is_actuatable_domain):
+  classified = []
+  for clause in split_disjunctions(node):
+    entities = get_used_entities(clause)
+    classified.append((clause, entities, get_actuatable_entities(entities, is_actuatable_domain)))
+  return classified
+
 # gives the body for false :- body
 def to_implication_form(node):
   return move_negations().visit(negate(node))
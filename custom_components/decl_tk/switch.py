@@ -15,7 +15,7 @@ from logging import Logger, getLogger
 logger = getLogger(__package__)
 
 from . import DOMAIN
-from time import sleep
+from time import sleep, monotonic
 from pathlib import Path
 from datetime import datetime
 
@@ -29,6 +29,31 @@ for rules_file_path in invariant_rules_files:
     with open(file=rules_file_path, encoding="UTF-8") as rules_file:
         invariant_rules += rules_file.read()
 
+# a domain is actuatable if the loaded rules can derive action/3 for its entities.
+# This is checked by grounding the rules for a probe entity of that domain which has
+# every base fact the switch may provide.
+_actuatable_domains = {}
+def is_actuatable_domain(domain):
+  if domain not in _actuatable_domains:
+    probe = quote(domain + '.decl_tk_probe')
+    probe_facts = [ 'domain(' + domain + ', ' + probe + ').'
+                  , 'actuatable(' + probe + ').'
+                  , 'was_state(' + probe + ', "decl_tk_probe").'
+                  , 'last_changed(' + probe + ', 0).'
+                  , 'select_option(' + probe + ', "decl_tk_probe").'
+                  , 'set_value(' + probe + ', min, 0).'
+                  , 'set_value(' + probe + ', max, 0).'
+                  ]
+    ctl = clingo.Control()
+    ctl.add("base", [], invariant_rules + '\n'.join(probe_facts))
+    ctl.ground([("base", [])])
+    _actuatable_domains[domain] = any(True for _ in ctl.symbolic_atoms.by_signature("action", 3))
+    logger.debug("Domain " + domain + " is " + ("" if _actuatable_domains[domain] else "not ") + "actuatable")
+  return _actuatable_domains[domain]
+
+# unsatisfiable results are reused for this long, as long as no used entity changed
+UNSATISFIABLE_CACHE_SECONDS = 60
+
 def setup_platform(
     hass: HomeAssistant,
     config: ConfigType,
@@ -53,7 +78,7 @@ def setup_platform(
 class InvariantSwitch(SwitchEntity, RestoreEntity):
 
     def __init__(self, hass, name, code, tracked_sensor) -> None:
-        from .parse import code_to_cnf, get_used_entities
+        from .parse import code_to_cnf, get_used_entities, get_actuatable_entities, classify_clauses
 
         self._name = name
         self._tracked_sensor = tracked_sensor
@@ -63,12 +88,20 @@ class InvariantSwitch(SwitchEntity, RestoreEntity):
         self._ast = code_to_cnf(code)
         self._entities = get_used_entities(self._ast)
         self._unsatisfiable = False
+        self._unsatisfiable_key = None
+        self._unsatisfiable_since = None
+        self._clauses = classify_clauses(self._ast, is_actuatable_domain)
+        self._actuatable_entities = get_actuatable_entities(self._entities, is_actuatable_domain)
+        logger.debug("Actuatable entities of " + name + ": " + repr(self._actuatable_entities))
+        if not self._actuatable_entities:
+          logger.warning('Invariant ' + name + ' contains no actuatable entities and can not be enforced')
 
     @property
     def extra_state_attributes(self):
         from ast import unparse
         return { 'code': self._code, 'code_cnf': unparse(self._ast),
-                 'tracked_invariant_sensor': self._tracked_sensor.entity_id, 'used_entities': list(self._entities), 'unsatisfiable': self._unsatisfiable}
+                 'tracked_invariant_sensor': self._tracked_sensor.entity_id, 'used_entities': list(self._entities),
+                 'actuatable_entities': list(self._actuatable_entities), 'unsatisfiable': self._unsatisfiable}
 
     @property
     def name(self) -> str:
@@ -116,8 +149,53 @@ class InvariantSwitch(SwitchEntity, RestoreEntity):
 
         self.async_write_ha_state()
 
+    def _set_unsatisfiable(self, unsatisfiable):
+        if self._unsatisfiable != unsatisfiable:
+            self._unsatisfiable = unsatisfiable
+            self.schedule_update_ha_state()
+
+    def _clause_holds(self, clause):
+        """Return whether the clause holds, None if it can not be decided without the solver."""
+        from .parse import eval_cnf
+        try:
+          return bool(eval_cnf(self.hass, clause))
+        except Exception:
+          return None
+
+    def _connected_entities(self, clauses):
+        # entities of the given clauses and of all clauses transitively sharing an entity with them.
+        # Other entities never need to change to restore the invariant.
+        connected = frozenset().union(*(entities for _, entities, _ in clauses))
+        changed = True
+        while changed:
+          changed = False
+          for _, entities, _ in self._clauses:
+            if entities & connected and not entities <= connected:
+              connected |= entities
+              changed = True
+        return connected
+
+    def _state_key(self):
+        # states are replaced on every change, so last_updated covers state and attributes
+        return tuple((e, self.hass.states.get(e).last_updated) for e in sorted(self._entities))
+
     async def async_update(self):
         if self.is_on is True and self._tracked_sensor.is_on is False:
+            holds = [(clause, self._clause_holds(clause[0])) for clause in self._clauses]
+            open_clauses = [clause for clause, h in holds if h is not True]
+            if not open_clauses:
+              logger.debug('Invariant ' + self._name + ' has no violated clause, nothing to do')
+              return
+            if all(h is False for _, h in holds if h is not True) and not any(actuatable for _, _, actuatable in open_clauses):
+              logger.debug('Invariant ' + self._name + ' is only violated in clauses without actuatable entities')
+              self._set_unsatisfiable(True)
+              return
+            state_key = self._state_key()
+            if self._unsatisfiable and state_key == self._unsatisfiable_key and monotonic() - self._unsatisfiable_since < UNSATISFIABLE_CACHE_SECONDS:
+              logger.debug('Invariant ' + self._name + ' is still not satisfiable, skipping solve')
+              return
+            choice_entities = self._actuatable_entities & self._connected_entities(open_clauses)
+
             from .parse import split_disjunctions, to_implication_form, implication_body_to_rule
             goal_rules = []
             for d in split_disjunctions(self._ast):
@@ -129,12 +207,15 @@ class InvariantSwitch(SwitchEntity, RestoreEntity):
             for e in self._entities:
               entity = self.hass.states.get(e)
               state_facts.append('was_state(' + quote(e) + ', '+ format_return_value(entity.state) +').')
-              state_facts.append('domain(' + entity.domain + ', '+ quote(e) +').')
+              domain = get_entity_domain(e)
+              state_facts.append('domain(' + domain + ', '+ quote(e) +').')
+              if e in choice_entities:
+                state_facts.append('actuatable(' + quote(e) + ').')
               state_facts.append('last_changed(' + quote(e) + ', '+ format_return_value(entity.last_changed) + ').')
-              if entity.domain in ('select', 'input_select'):
+              if domain in ('select', 'input_select'):
                 for option in entity.attributes['options']:
                   state_facts.append('select_option(' + quote(e) + ', '+ quote(option) +').')
-              if entity.domain in ('number', 'input_number'):
+              if domain in ('number', 'input_number'):
                 state_facts.append('set_value(' + quote(e) + ', min, ' + format_return_value(entity.attributes['min']) +').')
                 state_facts.append('set_value(' + quote(e) + ', max, ' + format_return_value(entity.attributes['max']) +').')
 
@@ -150,8 +231,8 @@ class InvariantSwitch(SwitchEntity, RestoreEntity):
                 models.append(model.symbols(atoms=True))
               logger.debug(str(len(models)) + " models found")
               if models:
-                self._unsatisfiable = False
-                self.schedule_update_ha_state()
+                self._unsatisfiable_key = None
+                self._set_unsatisfiable(False)
                 # mdl = choice(models)
                 mdl = models[-1]
                 logger.debug("Model found: " + " - " + repr(mdl))
@@ -163,10 +244,11 @@ class InvariantSwitch(SwitchEntity, RestoreEntity):
                     await self.hass.services.async_call(domain.name, service.name, {"entity_id" : entity.string} | kwargs)
               else:
                 logger.debug('Invariant ' + self._name + ' is currently not satisfiable')
-                self._unsatisfiable = True
-                self.schedule_update_ha_state()
+                self._unsatisfiable_key = state_key
+                self._unsatisfiable_since = monotonic()
+                self._set_unsatisfiable(True)
 
-from .parse import coerce_return_value
+from .parse import coerce_return_value, get_entity_domain
 
 def decode_args(args):
   def get_val_from_symbol(symbol):